@@ -0,0 +1,98 @@
+"""Micro-benchmark for the sentiment chunker on multi-megabyte inputs.
+
+Builds synthetic weekly content (mixed ASCII and multi-byte text, plus one
+run-on "sentence" longer than the chunk budget) and times iter_text_chunks
+against the previous split-and-join chunker. Chunking cost is also shown as a
+share of the Cloud Natural Language time for the same chunks, which should
+stay negligible.
+
+    python benchmarks/chunking_benchmark.py
+    python benchmarks/chunking_benchmark.py --megabytes 16 --overlap 2000 --max-tokens 200000
+"""
+import argparse
+import random
+import time
+
+from common import load_pipeline
+
+WORDS = ["model", "prompt", "career", "learning", "deployed", "feedback", "the", "a", "team", "naïve",
+         "café", "résumé", "données", "学习", "模型", "🚀", "great", "debugging", "API", "workflow"]
+
+def legacy_chunk_text(text, max_size=900000):
+    """The chunker this one replaced, kept for comparison."""
+    if len(text.encode('utf-8')) <= max_size:
+        return [text]
+    chunks = []
+    current_chunk = []
+    current_size = 0
+    for sentence in text.split('. '):
+        sentence_size = len((sentence + '. ').encode('utf-8'))
+        if current_size + sentence_size > max_size:
+            if current_chunk:
+                chunks.append(' '.join(current_chunk))
+                current_chunk = []
+                current_size = 0
+        current_chunk.append(sentence)
+        current_size += sentence_size
+    if current_chunk:
+        chunks.append(' '.join(current_chunk))
+    return chunks
+
+def build_text(megabytes, max_bytes, seed):
+    """Build roughly `megabytes` of sentence text with one oversized run-on sentence in the middle."""
+    rng = random.Random(seed)
+    target = megabytes * 1024 * 1024
+    parts = []
+    size = 0
+    run_on_at = target // 2
+    while size < target:
+        if run_on_at is not None and size >= run_on_at:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(max_bytes // 4))
+            run_on_at = None
+        else:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40))).capitalize()
+        sentence += rng.choice([". ", "! ", "? ", ".\n"])
+        parts.append(sentence)
+        size += len(sentence.encode("utf-8"))
+    return "".join(parts)
+
+def time_call(fn, repeat):
+    """Return the best wall time of `repeat` calls and the last result."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunker micro-benchmark")
+    parser.add_argument("--megabytes", type=int, nargs="+", default=[2, 8, 32], help="Input sizes to benchmark")
+    parser.add_argument("--max-bytes", type=int, default=900000, help="Chunk byte budget")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Optional chunk token budget")
+    parser.add_argument("--overlap", type=int, default=0, help="Overlap between chunks in bytes")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (best is reported)")
+    parser.add_argument("--api-latency-ms", type=float, default=300.0,
+                        help="Assumed Cloud NL latency per chunk, for the cost comparison")
+    args = parser.parse_args()
+
+    pipeline = load_pipeline()
+    print(f"{'input':>8} {'chunker':>8} {'seconds':>8} {'MB/s':>8} {'chunks':>6} {'largest':>9} {'vs API':>8}")
+    for megabytes in args.megabytes:
+        text = build_text(megabytes, args.max_bytes, seed=megabytes)
+        size = len(text.encode("utf-8"))
+        cases = [
+            ("stream", lambda: list(pipeline.iter_text_chunks(text, args.max_bytes, args.max_tokens, args.overlap))),
+            ("legacy", lambda: legacy_chunk_text(text, args.max_bytes)),
+        ]
+        for name, fn in cases:
+            elapsed, chunks = time_call(fn, args.repeat)
+            largest = max(len(chunk.encode("utf-8")) for chunk in chunks)
+            api_seconds = len(chunks) * args.api_latency_ms / 1000
+            flag = "" if largest <= args.max_bytes else " (over budget)"
+            print(f"{size / 1e6:>6.1f}MB {name:>8} {elapsed:>8.3f} {size / 1e6 / elapsed:>8.1f} {len(chunks):>6} "
+                  f"{largest:>9} {elapsed / api_seconds:>7.2%}{flag}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Shared helpers for the benchmark scripts in this directory."""
+import importlib.util
+import os
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_pipeline():
+    """Import bq-sentiment-analysis.py as a module."""
+    path = os.path.join(REPO_ROOT, "bq-sentiment-analysis.py")
+    spec = importlib.util.spec_from_file_location("bq_sentiment_analysis", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,553 @@
+"""End-to-end offline benchmark of the grading pipeline against local stand-ins.
+
+Runs the real main() flow with:
+
+- a fake BigQuery client whose task progress query streams N users x M tasks
+  of generated rows, page by page, and whose load and copy jobs take a
+  configurable time;
+- an OpenAI-compatible HTTP stub (the real OpenAI SDK talks to it through
+  OPENAI_BASE_URL) with configurable latency and 429 rate, and Files and
+  Batches endpoints for --batch runs;
+- a fake Cloud Natural Language async client for the sentiment stage, which
+  is run separately over one weekly text per user.
+
+It reports rows/sec, p50/p99 latency per stage, peak RSS and API call counts.
+
+    python benchmarks/pipeline_benchmark.py
+    python benchmarks/pipeline_benchmark.py --users 500 --tasks 12 --openai-latency-ms 400 --rate-limit 0.05
+    python benchmarks/pipeline_benchmark.py --batch --batch-max-file-mb 0.5
+    python benchmarks/pipeline_benchmark.py --json-out bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import email.parser
+import email.policy
+import functools
+import http.server
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.request
+
+from common import load_pipeline
+
+WORDS = ["model", "prompt", "career", "learning", "deployed", "feedback", "the", "a", "team", "we", "built",
+         "great", "debugging", "API", "workflow", "users", "improve", "AI", "skills", "because", "tested"]
+
+class StageTimer:
+    """Thread-safe collection of per-stage durations."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[stage] = {
+                "count": len(ordered),
+                "p50_ms": ordered[len(ordered) // 2] * 1000,
+                "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+                "total_s": sum(ordered),
+            }
+        return result
+
+class Counters:
+    """Thread-safe named counters for API calls."""
+
+    def __init__(self):
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + amount
+
+def sentence(rng, words=(8, 24)):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(*words))).capitalize() + "."
+
+def text_of(rng, chars):
+    parts = []
+    size = 0
+    while size < chars:
+        parts.append(sentence(rng))
+        size += len(parts[-1]) + 1
+    return " ".join(parts)
+
+class OpenAIStubHandler(http.server.BaseHTTPRequestHandler):
+    """Minimal OpenAI endpoints: chat completions returning criteria or grading JSON, plus the Files and
+    Batches endpoints used by --batch; GET /stats returns call counts.
+
+    Prompt caching is imitated by reporting every message before the last as
+    cached once the same leading messages have been seen; unlike the real
+    service there is no minimum prefix length. Batches run in a background
+    thread without latency or 429s, and uploads over --batch-max-file-mb are
+    rejected like oversized batch input files.
+    """
+
+    protocol_version = "HTTP/1.1"
+    config = None
+    counters = None
+    files = None
+    batches = None
+    seen_prefixes = set()
+    seen_prefixes_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        parts = path.strip("/").split("/")
+        if parts[-1] == "content" and "files" in parts:
+            self._send_bytes(200, self.files[parts[-2]]["content"], "application/octet-stream")
+        elif "batches" in parts:
+            self._send(200, self.batches[parts[-1]])
+        else:
+            self._send(200, self.counters.values)
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?")[0]
+        if path.endswith("/files"):
+            self._upload_file(data)
+            return
+        body = json.loads(data or b"{}")
+        if path.endswith("/batches"):
+            self._create_batch(body)
+            return
+        completion_tokens = self.completion_tokens(body)
+        # Latency scales with the completion length, like a real model's decode time
+        time.sleep(self.config.openai_latency_ms * completion_tokens / 180 * random.uniform(0.9, 1.1) / 1000)
+        if random.random() < self.config.rate_limit:
+            self.counters.add("openai_429")
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                       {"retry-after": "0.2"})
+            return
+        self._send(200, self.complete(body, completion_tokens))
+
+    @staticmethod
+    def packed_count(body):
+        system_prompt = body["messages"][0]["content"] if body.get("messages") else ""
+        return body["messages"][-1]["content"].count("Student Response (id ") if "JSON array" in system_prompt else 0
+
+    def completion_tokens(self, body):
+        return sum(random.randint(60, 300) for _ in range(max(1, self.packed_count(body))))
+
+    def complete(self, body, completion_tokens):
+        """Build the chat completion for a request body, counting it by kind."""
+        config = self.config
+        system_prompt = body["messages"][0]["content"] if body.get("messages") else ""
+        packed_count = self.packed_count(body)
+        if "evaluation criteria for educational tasks" in system_prompt:
+            self.counters.add("openai_criteria")
+            content = json.dumps({"task_summary": "Summarize the week's work",
+                                  "evaluation_criteria": "Completeness, accuracy and reflection"})
+        elif packed_count:
+            self.counters.add("openai_packed_grading")
+            self.counters.add("openai_packed_responses", packed_count)
+            evaluations = [{"id": str(i), "score": round(random.random(), 2), "feedback": "Solid work with clear reasoning.",
+                            "missing_aspects": "More concrete examples"} for i in range(1, packed_count + 1)]
+            if random.random() < config.packed_malformed:
+                # Drop one evaluation so the pipeline has to regrade that response on its own
+                evaluations.pop(random.randrange(packed_count))
+            content = json.dumps(evaluations)
+        else:
+            self.counters.add("openai_grading")
+            content = json.dumps({"score": round(random.random(), 2), "feedback": "Solid work with clear reasoning.",
+                                  "missing_aspects": "More concrete examples"})
+        messages = body.get("messages", [])
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        prefix = json.dumps(messages[:-1], sort_keys=True)
+        with self.seen_prefixes_lock:
+            cached = prefix in self.seen_prefixes
+            self.seen_prefixes.add(prefix)
+        cached_tokens = sum(len(m.get("content", "")) for m in messages[:-1]) // 4 if cached else 0
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "gpt-4"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+        }
+
+    def _store_file(self, content, filename, purpose):
+        file_id = f"file-{len(self.files) + 1}"
+        self.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                               "filename": filename, "purpose": purpose, "status": "processed", "content": content}
+        return {key: value for key, value in self.files[file_id].items() if key != "content"}
+
+    def _upload_file(self, data):
+        message = email.parser.BytesParser(policy=email.policy.default).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + data
+        )
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+        content = fields["file"].get_payload(decode=True)
+        if len(content) > self.config.batch_max_file_mb * 1024 * 1024:
+            self.counters.add("openai_files_rejected")
+            self._send(400, {"error": {"message": "File is larger than the batch input limit",
+                                       "type": "invalid_request_error"}})
+            return
+        self.counters.add("openai_files")
+        self._send(200, self._store_file(content, fields["file"].get_filename(), fields["purpose"].get_content().strip()))
+
+    def _create_batch(self, body):
+        self.counters.add("openai_batches")
+        batch_id = f"batch-{len(self.batches) + 1}"
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "errors": None,
+            "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+            "status": "in_progress", "output_file_id": None, "error_file_id": None, "created_at": int(time.time()),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        threading.Thread(target=self._run_batch, args=(batch_id,), daemon=True).start()
+        self._send(200, self.batches[batch_id])
+
+    def _run_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        requests = [json.loads(line) for line in self.files[batch["input_file_id"]]["content"].splitlines() if line]
+        batch["request_counts"]["total"] = len(requests)
+        output = []
+        for request in requests:
+            completion = self.complete(request["body"], self.completion_tokens(request["body"]))
+            output.append(json.dumps({"id": f"batch_req_{len(output) + 1}", "custom_id": request["custom_id"],
+                                      "response": {"status_code": 200, "request_id": "req-bench", "body": completion},
+                                      "error": None}))
+            batch["request_counts"]["completed"] += 1
+        batch["output_file_id"] = self._store_file(("\n".join(output) + "\n").encode("utf-8"),
+                                                   f"{batch_id}_output.jsonl", "batch_output")["id"]
+        batch["status"] = "completed"
+
+    def _send(self, status, payload, headers=None):
+        self._send_bytes(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _send_bytes(self, status, data, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def serve_openai_stub(config, ready):
+    """Run the stub server; started in its own process so it does not compete with the pipeline for the GIL."""
+    random.seed(config.seed)
+    handler = type("BoundOpenAIStubHandler", (OpenAIStubHandler,),
+                   {"config": config, "counters": Counters(), "files": {}, "batches": {}})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+def start_openai_stub(config):
+    """Start the stub in a child process and return (process, port)."""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_openai_stub, args=(config, ready), daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+def openai_stub_stats(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as response:
+        return json.loads(response.read())
+
+class FakeJob:
+    """Query, load or copy job whose result() takes a fixed time."""
+
+    def __init__(self, rows=(), latency=0.0, page_latency=0.0, timer=None):
+        self.rows = rows
+        self.latency = latency
+        self.page_latency = page_latency
+        self.timer = timer
+        self.errors = None
+
+    def result(self, page_size=None):
+        time.sleep(self.latency)
+        if page_size is None:
+            return list(self.rows)
+        return types.SimpleNamespace(pages=self._pages(page_size))
+
+    def _pages(self, page_size):
+        page = []
+        for row in self.rows:
+            page.append(row)
+            if len(page) == page_size:
+                yield self._fetch(page)
+                page = []
+        if page:
+            yield self._fetch(page)
+
+    def _fetch(self, page):
+        start = time.perf_counter()
+        time.sleep(self.page_latency)
+        self.timer.record("bq_page_fetch", time.perf_counter() - start)
+        return page
+
+class FakeBigQueryClient:
+    """Enough of bigquery.Client for the grading run, backed by generated task rows."""
+
+    def __init__(self, config, timer, counters, layouts):
+        self.config = config
+        self.timer = timer
+        self.counters = counters
+        # Existing tables already have the pipeline's layout, so no migration runs
+        self.layouts = layouts
+
+    def task_rows(self):
+        rng = random.Random(self.config.seed)
+        week_start = datetime.date(2025, 3, 17)
+        questions = json.dumps(["What did you build this week?", "What did you learn?", "What would you change?"])
+        descriptions = {task_id: sentence(rng) for task_id in range(1, self.config.tasks + 1)}
+        earlier = {task_id: [] for task_id in range(1, self.config.tasks + 1)}
+        for user_id in range(1, self.config.users + 1):
+            for task_id in range(1, self.config.tasks + 1):
+                if earlier[task_id] and rng.random() < self.config.duplicate_rate:
+                    # A pasted template answer, sometimes with a small edit
+                    user_content = rng.choice(earlier[task_id])
+                    if rng.random() < 0.5:
+                        user_content += " Thanks."
+                else:
+                    user_content = text_of(rng, self.config.response_chars)
+                    earlier[task_id].append(user_content)
+                yield types.SimpleNamespace(
+                    user_id=user_id, task_id=task_id, week_start=week_start,
+                    task_questions=questions, user_content=user_content,
+                    task_title=f"Task {task_id}", task_description=descriptions[task_id], deliverable_type="text",
+                )
+
+    def query(self, sql, job_config=None, **kwargs):
+        self.counters.add("bq_queries")
+        if "INFORMATION_SCHEMA" in sql:
+            return FakeJob([types.SimpleNamespace(column_name="task_id", data_type="INT64")])
+        if "weekly_submissions" in sql:
+            # Shards are split on user_id modulo the shard count instead of FARM_FINGERPRINT
+            params = {p.name: p.value for p in getattr(job_config, "query_parameters", None) or []}
+            shard, num_shards = params.get("shard", 0), params.get("num_shards", 1)
+            rows = (row for row in self.task_rows() if row.user_id % num_shards == shard)
+            return FakeJob(rows, page_latency=self.config.bq_page_latency_ms / 1000, timer=self.timer)
+        return FakeJob(latency=self.config.bq_job_latency_ms / 1000)
+
+    def load_table_from_json(self, rows, table_id, job_config=None):
+        self.counters.add("bq_load_jobs")
+        self.counters.add("bq_rows_loaded", len(rows))
+        return FakeJob(latency=self.config.bq_job_latency_ms / 1000)
+
+    def copy_table(self, source, destination, job_config=None):
+        self.counters.add("bq_copy_jobs")
+        return FakeJob(latency=self.config.bq_job_latency_ms / 1000)
+
+    def create_table(self, table, exists_ok=False):
+        return table
+
+    def update_table(self, table, fields):
+        return table
+
+    def get_table(self, table_id):
+        layout = self.layouts.get(table_id, {})
+        partition_field = layout.get("partition_field")
+        return types.SimpleNamespace(
+            table_id=table_id, schema=[],
+            time_partitioning=types.SimpleNamespace(field=partition_field) if partition_field else None,
+            clustering_fields=layout.get("clustering_fields"),
+        )
+
+    def delete_table(self, table_id, not_found_ok=False):
+        return None
+
+class FakeLanguageServiceAsyncClient:
+    """Stand-in for LanguageServiceAsyncClient.analyze_sentiment."""
+
+    def __init__(self, config, counters):
+        self.config = config
+        self.counters = counters
+        self.transport = types.SimpleNamespace(close=self.close)
+
+    async def close(self):
+        self.counters.add("language_clients_closed")
+
+    async def analyze_sentiment(self, request, timeout=None):
+        self.counters.add("language_calls")
+        await asyncio.sleep(max(0.0, random.gauss(self.config.language_latency_ms, self.config.language_latency_ms / 4)) / 1000)
+        return types.SimpleNamespace(document_sentiment=types.SimpleNamespace(score=random.uniform(-0.2, 0.9),
+                                                                              magnitude=random.uniform(0.2, 3.0)))
+
+async def run_sentiment_stage(pipeline, config):
+    rng = random.Random(config.seed + 1)
+    users = [
+        {"user_id": user_id, "user_name": f"user{user_id}", "week_start": datetime.date(2025, 3, 17),
+         "message_count": 20, "weekly_content": text_of(rng, config.sentiment_chars)}
+        for user_id in range(1, config.users + 1)
+    ]
+    results = 0
+    async for result in pipeline.stream_user_sentiments(users):
+        results += result is not None
+    await pipeline.get_sentiment_backend().close()
+    return results
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--users", type=int, default=200, help="Users in the generated task progress result")
+    parser.add_argument("--tasks", type=int, default=8, help="Tasks per user")
+    parser.add_argument("--response-chars", type=int, default=1500, help="Approximate size of each task response")
+    parser.add_argument("--sentiment-chars", type=int, default=20000, help="Approximate size of each user's weekly text")
+    parser.add_argument("--openai-latency-ms", type=float, default=300.0, help="Mean OpenAI stub latency")
+    parser.add_argument("--rate-limit", type=float, default=0.01,
+                        help="Fraction of OpenAI requests answered with 429 (each one halves the adaptive concurrency limit)")
+    parser.add_argument("--language-latency-ms", type=float, default=150.0, help="Mean Cloud NL stub latency")
+    parser.add_argument("--bq-page-latency-ms", type=float, default=50.0, help="Time to fetch one result page")
+    parser.add_argument("--bq-job-latency-ms", type=float, default=200.0, help="Time for a load, copy or DML job")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="Passed through to the pipeline")
+    parser.add_argument("--packed-grading", action="store_true", help="Grade several responses per request")
+    parser.add_argument("--batch", action="store_true", help="Grade through the stub's Files and Batches endpoints")
+    parser.add_argument("--batch-max-file-mb", type=float, default=200.0,
+                        help="Batch input file size limit, enforced by the stub and passed to the pipeline")
+    parser.add_argument("--shard", type=int, default=0, help="Passed through to the pipeline")
+    parser.add_argument("--num-shards", type=int, default=1,
+                        help="Passed through to the pipeline; the run grades only its shard of the users")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="Fraction of responses copied from an earlier response to the task (half with a small edit)")
+    parser.add_argument("--near-duplicate-threshold", type=float, help="Passed through to the pipeline")
+    parser.add_argument("--packed-malformed", type=float, default=0.05,
+                        help="Fraction of packed answers missing one evaluation")
+    parser.add_argument("--skip-sentiment", action="store_true", help="Only benchmark the grading run")
+    parser.add_argument("--show-output", action="store_true", help="Show the pipeline's own prints and logs")
+    parser.add_argument("--json-out", help="Also write the report to this JSON file")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+def main():
+    config = parse_args()
+    random.seed(config.seed)
+    timer = StageTimer()
+    counters = Counters()
+
+    stub, stub_port = start_openai_stub(config)
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{stub_port}/v1"
+
+    pipeline = load_pipeline()
+    pipeline.clients._instances["bigquery"] = FakeBigQueryClient(config, timer, counters, pipeline.TABLE_LAYOUTS)
+    pipeline.clients.language_async_client = lambda: FakeLanguageServiceAsyncClient(config, counters)
+    for stage, name in [("grade_response", "process_journaled_task_response"),
+                        ("openai_completion", "create_chat_completion"),
+                        ("criteria_generation", "generate_task_evaluation_criteria"),
+                        ("sentiment_user", "analyze_user_sentiment_async"),
+                        ("chunk_text", "chunk_text")]:
+        setattr(pipeline, name, timer.wrap(stage, getattr(pipeline, name)))
+    original_load = pipeline.BatchedTableWriter._load
+    pipeline.BatchedTableWriter._load = lambda writer, batch: timer.wrap("bq_load_batch", original_load)(writer, batch)
+
+    report = {"config": vars(config)}
+    with tempfile.TemporaryDirectory() as workdir:
+        argv = ["--run-id", "benchmark", "--journal-dir", os.path.join(workdir, "journals"),
+                "--batch-dir", os.path.join(workdir, "batch"), "--no-completion-cache",
+                "--metrics-dir", os.path.join(workdir, "metrics"),
+                "--max-concurrency", str(config.max_concurrency),
+                "--openai-rpm", "1000000", "--openai-tpm", "1000000000"]
+        # The pipeline sets up its own logging, so quieten it through its flag
+        if not config.show_output:
+            argv += ["--log-level", "WARNING"]
+        if config.packed_grading:
+            argv.append("--packed-grading")
+        if config.batch:
+            argv += ["--batch", "--batch-poll-seconds", "1"]
+            pipeline.BATCH_MAX_FILE_BYTES = int(config.batch_max_file_mb * 1024 * 1024)
+        if config.num_shards > 1:
+            argv += ["--shard", str(config.shard), "--num-shards", str(config.num_shards)]
+        if config.near_duplicate_threshold:
+            argv += ["--near-duplicate-threshold", str(config.near_duplicate_threshold)]
+        quiet = contextlib.nullcontext() if config.show_output else contextlib.redirect_stdout(open(os.devnull, "w"))
+        with quiet:
+            start = time.perf_counter()
+            pipeline.main(argv)
+            grading_seconds = time.perf_counter() - start
+            if not config.skip_sentiment:
+                start = time.perf_counter()
+                sentiment_users = asyncio.run(run_sentiment_stage(pipeline, config))
+                sentiment_seconds = time.perf_counter() - start
+        metrics_name = f"benchmark-shard_{config.shard}_of_{config.num_shards}" if config.num_shards > 1 else "benchmark"
+        with open(os.path.join(workdir, "metrics", f"{metrics_name}.json")) as f:
+            report["pipeline_metrics"] = json.load(f)
+
+    for name, value in openai_stub_stats(stub_port).items():
+        counters.add(name, value)
+    stub.terminate()
+    graded_rows = counters.values.get("openai_grading", 0) + counters.values.get("openai_packed_responses", 0)
+    task_rows = report["pipeline_metrics"]["counters"].get("bigquery.rows_read", 0)
+    report["grading"] = {"seconds": grading_seconds, "rows": task_rows, "rows_per_sec": task_rows / grading_seconds}
+    if not config.skip_sentiment:
+        report["sentiment"] = {"seconds": sentiment_seconds, "users": sentiment_users,
+                               "users_per_sec": sentiment_users / sentiment_seconds}
+        backend = pipeline.get_sentiment_backend()
+        if hasattr(backend, "stats"):
+            report["sentiment"].update(backend.stats)
+    report["stages"] = timer.summary()
+    report["calls"] = dict(sorted(counters.values.items()))
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    print(f"Grading: {report['grading']['rows']} rows in {grading_seconds:.2f}s "
+          f"({report['grading']['rows_per_sec']:.1f} rows/sec, {graded_rows} graded by the stub)")
+    if not config.skip_sentiment:
+        escalation = ""
+        if "escalated" in report["sentiment"]:
+            escalation = (f", {report['sentiment']['fast']} chunks scored locally, "
+                          f"{report['sentiment']['escalated']} escalated to Cloud NL")
+        print(f"Sentiment: {sentiment_users} users in {sentiment_seconds:.2f}s "
+              f"({report['sentiment']['users_per_sec']:.1f} users/sec{escalation})")
+    print(f"Peak RSS: {report['peak_rss_mb']:.0f} MB")
+    print(f"OpenAI tokens per graded response: {report['pipeline_metrics']['openai_tokens_per_graded_response']}, "
+          f"cached prompt fraction: {report['pipeline_metrics']['openai_cached_prompt_fraction']}")
+    print()
+    print(f"{'stage':<22} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'total s':>9}")
+    for stage, stats in sorted(report["stages"].items()):
+        print(f"{stage:<22} {stats['count']:>7} {stats['p50_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['total_s']:>9.2f}")
+    print()
+    print("API calls: " + ", ".join(f"{name}={value}" for name, value in report["calls"].items()))
+
+    if config.json_out:
+        with open(config.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Calibrate the local lexicon sentiment engine against archived Cloud Natural Language results.
+
+The peer-feedback archive (archive/feedback-results-*.json) stores the Cloud NL
+sentiment_score and sentiment_magnitude for every feedback text, so it doubles
+as a labelled set. This script scores the same texts with the lexicon engine
+and reports throughput, agreement with Cloud NL, and how many texts would be
+escalated at a range of confidence thresholds. It runs fully offline.
+
+    python benchmarks/sentiment_calibration.py
+    python benchmarks/sentiment_calibration.py --thresholds 0.3 0.5 0.7
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from common import REPO_ROOT, load_pipeline
+
+def load_archive(pattern):
+    """Load (text, score, magnitude) records from the feedback archive, skipping empty texts."""
+    records = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            for item in json.load(f):
+                text = (item.get("feedback_text") or "").strip()
+                if text and item.get("sentiment_score") is not None:
+                    records.append((text, float(item["sentiment_score"]), float(item.get("sentiment_magnitude") or 0.0)))
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="Lexicon sentiment engine calibration benchmark")
+    parser.add_argument("--archive", default=os.path.join(REPO_ROOT, "archive", "feedback-results-*.json"),
+                        help="Glob of archived feedback result files")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.2, 0.3, 0.4, 0.5, 0.6, 0.7],
+                        help="Escalation confidence thresholds to evaluate")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed scoring passes over the archive")
+    args = parser.parse_args()
+
+    pipeline = load_pipeline()
+    records = load_archive(args.archive)
+    if not records:
+        raise SystemExit(f"No archived feedback found for {args.archive}")
+    texts = [text for text, _, _ in records]
+    expected = np.array([score for _, score, _ in records])
+
+    backend = pipeline.LexiconSentimentBackend()
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        results = backend.score_texts(texts)
+    elapsed = (time.perf_counter() - start) / args.repeat
+
+    scores = np.array([r["score"] for r in results])
+    confidence = np.array([r["confidence"] for r in results])
+    expected_categories = [pipeline.interpret_sentiment(s)[0] for s in expected]
+    local_categories = [pipeline.interpret_sentiment(s)[0] for s in scores]
+    agrees = np.array([a == b for a, b in zip(expected_categories, local_categories)])
+    same_sign = np.sign(np.round(scores, 1)) == np.sign(np.round(expected, 1))
+
+    print(f"Texts: {len(texts)} from {args.archive}")
+    print(f"Throughput: {len(texts) / elapsed:,.0f} texts/sec ({elapsed * 1000:.1f} ms per pass)")
+    print(f"All texts: MAE {np.mean(np.abs(scores - expected)):.3f}, "
+          f"correlation {np.corrcoef(scores, expected)[0, 1]:.3f}, "
+          f"category agreement {agrees.mean():.1%}, polarity agreement {same_sign.mean():.1%}")
+    print()
+    print(f"{'threshold':>9} {'kept local':>10} {'escalated':>9} {'local MAE':>9} {'local cat. agree':>16} {'local polarity':>14}")
+    for threshold in args.thresholds:
+        local = confidence >= threshold
+        if local.any():
+            mae = np.mean(np.abs(scores[local] - expected[local]))
+            print(f"{threshold:>9.2f} {local.mean():>10.1%} {1 - local.mean():>9.1%} {mae:>9.3f} "
+                  f"{agrees[local].mean():>16.1%} {same_sign[local].mean():>14.1%}")
+        else:
+            print(f"{threshold:>9.2f} {0:>10.1%} {1:>9.1%} {'-':>9} {'-':>16} {'-':>14}")
+
+if __name__ == "__main__":
+    main()
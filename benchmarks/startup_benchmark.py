@@ -0,0 +1,70 @@
+"""Startup-time benchmark: how long importing bq-sentiment-analysis.py takes for its helpers.
+
+Each sample imports the module in a fresh interpreter and times the import
+alone, then checks that none of the heavy SDKs (google.cloud, openai,
+requests, numpy) were loaded and that no client was created. Importing just
+the standard-library modules the script uses is timed for reference.
+
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --samples 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import REPO_ROOT
+
+HEAVY_PACKAGES = ("google", "openai", "requests", "numpy", "grpc")
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {benchmarks_dir!r})
+from common import load_pipeline
+pipeline = load_pipeline()
+import_seconds = time.perf_counter() - start
+start = time.perf_counter()
+pipeline.chunk_text("Hello world. " * 1000)
+pipeline.assess_sentiment_reason("AI helped my career growth.")
+pipeline.clean_text("  a  b ")
+pipeline.interpret_sentiment(0.4)
+helpers_seconds = time.perf_counter() - start
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"import": import_seconds, "helpers": helpers_seconds, "heavy": heavy,
+                  "clients": len(pipeline.clients._instances)}}))
+"""
+
+STDLIB_PROBE = """
+import json, time
+start = time.perf_counter()
+import argparse, asyncio, bisect, concurrent.futures, hashlib, logging, random, re, shutil, sqlite3, threading
+print(json.dumps({"import": time.perf_counter() - start}))
+"""
+
+def run_probe(code):
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True, cwd=REPO_ROOT)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Module import time benchmark")
+    parser.add_argument("--samples", type=int, default=10, help="Fresh interpreters to time")
+    args = parser.parse_args()
+
+    probe = IMPORT_PROBE.format(benchmarks_dir=os.path.dirname(os.path.abspath(__file__)), heavy=HEAVY_PACKAGES)
+    samples = [run_probe(probe) for _ in range(args.samples)]
+    imports = [s["import"] * 1000 for s in samples]
+    helpers = [s["helpers"] * 1000 for s in samples]
+
+    baseline = [run_probe(STDLIB_PROBE)["import"] * 1000 for _ in range(args.samples)]
+
+    print(f"Module import: median {statistics.median(imports):.1f} ms, max {max(imports):.1f} ms ({args.samples} samples)")
+    print(f"First helper calls: median {statistics.median(helpers):.1f} ms")
+    print(f"Standard-library imports alone (reference): median {statistics.median(baseline):.1f} ms")
+    print(f"Heavy SDKs loaded by import: {samples[0]['heavy'] or 'none'}")
+    print(f"Clients created by import: {samples[0]['clients']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Shared fixtures for the grading pipeline tests."""
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from common import load_pipeline  # noqa: E402
+
+ANSWER = ("I built a small retrieval pipeline this week and learned how chunk size changes the answers "
+          "it gives. Next time I would start with evaluation before tuning anything else.")
+
+def make_task_data(user_id, task_id=1, user_content=ANSWER, questions='["What did you build?"]',
+                   week_start=datetime.date(2025, 3, 15)):
+    """A task response row as iter_task_data() yields it."""
+    return {
+        "user_id": user_id, "task_id": task_id, "week_start": week_start,
+        "questions": questions, "user_content": user_content,
+        "task_title": f"Task {task_id}", "task_description": "Describe your week",
+    }
+
+def make_graded_row(data, score="0.8"):
+    """The task_responses row a successful grade of ``data`` produces."""
+    return {
+        "user_id": data["user_id"], "task_id": data["task_id"], "date": data["week_start"].isoformat(),
+        "response_content": data["user_content"], "questions": "Q1", "scores": score, "feedback": "Good",
+        "missing_aspects": "None", "grading_timestamp": "2025-03-20T00:00:00+00:00",
+        "content_hash": "hash", "criteria_hash": "criteria",
+    }
+
+@pytest.fixture
+def pipeline():
+    """A freshly imported pipeline module, so its globals don't leak between tests."""
+    return load_pipeline()
+
+@pytest.fixture
+def task_data():
+    """Factory for task response rows: ``task_data(user_id, task_id=1, ...)``."""
+    return make_task_data
+
+@pytest.fixture
+def graded_row():
+    """Factory for the graded task_responses row of a task response: ``graded_row(data, score="0.8")``."""
+    return make_graded_row
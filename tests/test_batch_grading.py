@@ -0,0 +1,85 @@
+"""Tests for grading through the OpenAI Batch API."""
+import json
+import types
+
+import pytest
+
+GRADE = json.dumps({"score": 0.7, "feedback": "Good", "missing_aspects": "None"})
+
+class FakeOpenAIClient:
+    """Files and Batches endpoints whose batches finish with a chosen status and set of answered requests."""
+
+    def __init__(self, status, answered=None):
+        self.status = status
+        self.answered = answered
+        self.files_content = {}
+        self.submitted = []
+        self.batch_outputs = {}
+        self.files = types.SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = types.SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _create_file(self, file, purpose):
+        file_id = f"file-{len(self.files_content)}"
+        self.files_content[file_id] = file.read().decode("utf-8")
+        return types.SimpleNamespace(id=file_id)
+
+    def _file_content(self, file_id):
+        return types.SimpleNamespace(text=self.files_content[file_id])
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        requests = [json.loads(line) for line in self.files_content[input_file_id].splitlines()]
+        self.submitted.append([request["custom_id"] for request in requests])
+        output = "\n".join(
+            json.dumps({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": {
+                "choices": [{"message": {"content": GRADE}}]}}})
+            for request in requests if self.answered is None or request["custom_id"] in self.answered
+        )
+        output_file_id = f"file-{len(self.files_content)}"
+        self.files_content[output_file_id] = output
+        batch_id = f"batch-{len(self.submitted)}"
+        self.batch_outputs[batch_id] = output_file_id
+        return types.SimpleNamespace(id=batch_id)
+
+    def _retrieve_batch(self, batch_id):
+        return types.SimpleNamespace(id=batch_id, status=self.status, output_file_id=self.batch_outputs[batch_id],
+                                     error_file_id=None, request_counts=None)
+
+class FakeWriter:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+def staged_batch_run(pipeline, batch_dir, custom_ids):
+    """Lay out a prepared, not yet submitted batch run with one request per custom_id."""
+    with open(batch_dir / "requests-000.jsonl", "w") as f:
+        for custom_id in custom_ids:
+            f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+                                "body": {}}) + "\n")
+    with open(batch_dir / "rows.jsonl", "w") as f:
+        for user_id, custom_id in enumerate(custom_ids, start=1):
+            row = {"user_id": user_id, "task_id": 1, "date": "2025-03-15", "response_content": "Answer",
+                   "questions": "Q1", "content_hash": "hash", "criteria_hash": "criteria"}
+            f.write(json.dumps({"custom_id": custom_id, "cache_key": custom_id, "row": row}) + "\n")
+    (batch_dir / "criteria.json").write_text("[]")
+    pipeline.save_batch_state(str(batch_dir / "state.json"),
+                              {"batches": [{"input_path": str(batch_dir / "requests-000.jsonl"), "batch_id": None}]})
+    return types.SimpleNamespace(batch_dir=str(batch_dir), batch_poll_seconds=0)
+
+def test_incomplete_batch_writes_nothing_and_resubmits_only_missing_requests(pipeline, tmp_path):
+    pipeline.completion_cache = None
+    args = staged_batch_run(pipeline, tmp_path, ["a", "b", "c"])
+    client = FakeOpenAIClient("expired", answered={"a"})
+    pipeline.clients._instances["openai"] = client
+    writer = FakeWriter()
+
+    with pytest.raises(Exception, match="2 batch requests did not complete"):
+        pipeline.run_batch_grading(args, None, writer)
+    assert writer.rows == []
+
+    client.status, client.answered = "completed", None
+    pipeline.run_batch_grading(args, None, writer)
+
+    assert client.submitted == [["a", "b", "c"], ["b", "c"]]
+    assert [row["user_id"] for row in writer.rows] == [1, 2, 3]
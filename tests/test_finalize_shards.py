@@ -0,0 +1,88 @@
+"""Tests for combining sharded runs with --finalize."""
+import types
+
+import pytest
+
+class FakeBigQueryClient:
+    """Records queries against a fixed set of tables."""
+
+    def __init__(self, pipeline, tables):
+        self.pipeline = pipeline
+        self.tables = tables
+        self.queries = []
+
+    def get_table(self, table_id):
+        if table_id not in self.tables:
+            raise self.pipeline.google_exceptions.NotFound(table_id)
+        return self.tables[table_id]
+
+    def query(self, sql, job_config=None):
+        self.queries.append(sql)
+        return types.SimpleNamespace(result=lambda: [], errors=None)
+
+    def create_table(self, table, exists_ok=False):
+        return self.tables.get(table.table_id, types.SimpleNamespace(schema=[]))
+
+    def update_table(self, table, fields):
+        return table
+
+    def copy_table(self, source, destination, job_config=None):
+        return types.SimpleNamespace(result=lambda: None, errors=None)
+
+    def delete_table(self, table_id, not_found_ok=False):
+        pass
+
+def table(labels=None, schema=()):
+    return types.SimpleNamespace(labels=labels, schema=list(schema), time_partitioning=None, clustering_fields=None)
+
+def staged_shards(pipeline, shard_labels):
+    """Staging tables for every shard, with each shard's labels, plus the laid-out output tables."""
+    tables = {}
+    for shard, labels in enumerate(shard_labels):
+        label = pipeline.shard_label(shard, len(shard_labels))
+        for table_id in (pipeline.TASK_RESPONSES_TABLE_ID, pipeline.TASK_CRITERIA_TABLE_ID):
+            tables[pipeline.staging_table_id(table_id, label)] = table(labels)
+    for table_id, schema in ((pipeline.TASK_RESPONSES_TABLE_ID, pipeline.task_responses_schema()),
+                             (pipeline.TASK_CRITERIA_TABLE_ID, pipeline.task_criteria_schema())):
+        layout = pipeline.TABLE_LAYOUTS[table_id]
+        tables[table_id] = table(schema=schema)
+        if layout["partition_field"]:
+            tables[table_id].time_partitioning = types.SimpleNamespace(field=layout["partition_field"])
+        tables[table_id].clustering_fields = layout["clustering_fields"]
+    client = FakeBigQueryClient(pipeline, tables)
+    pipeline.clients._instances["bigquery"] = client
+    return client
+
+def shard_args(pipeline, argv):
+    return pipeline.parse_args(argv + ["--num-shards", "2"])
+
+def test_finalize_refuses_shards_graded_for_different_weeks(pipeline):
+    client = staged_shards(pipeline, [
+        pipeline.staging_labels(shard_args(pipeline, ["--start-week", "2025-03-22"])),
+        pipeline.staging_labels(shard_args(pipeline, [])),
+    ])
+
+    with pytest.raises(Exception, match="different modes or weeks"):
+        pipeline.finalize_shards(shard_args(pipeline, ["--finalize"]))
+    assert client.queries == []
+
+def test_finalize_refuses_unlabeled_shards(pipeline):
+    client = staged_shards(pipeline, [None, None])
+
+    with pytest.raises(Exception, match="staged without their grading mode and weeks"):
+        pipeline.finalize_shards(shard_args(pipeline, ["--finalize"]))
+    assert client.queries == []
+
+def test_finalize_uses_the_mode_and_weeks_the_shards_ran_with(pipeline):
+    shard_labels = pipeline.staging_labels(shard_args(pipeline, ["--incremental", "--start-week", "2025-03-22",
+                                                                 "--end-week", "2025-03-29"]))
+    client = staged_shards(pipeline, [shard_labels, shard_labels])
+    args = shard_args(pipeline, ["--finalize"])
+
+    pipeline.finalize_shards(args)
+
+    assert args.incremental
+    assert (args.start_week.isoformat(), args.end_week.isoformat()) == ("2025-03-22", "2025-03-29")
+    # Incremental shards are merged; a full replace would delete the covered weeks
+    assert any("MERGE" in query for query in client.queries)
+    assert not any("DELETE FROM" in query for query in client.queries)
@@ -0,0 +1,48 @@
+"""Tests for per-host concurrency limits in the link validator."""
+import asyncio
+import threading
+import time
+
+SLOW_SECONDS = 0.5
+
+def slow_host_validator(pipeline, monkeypatch):
+    """A validator whose requests to slow.example take SLOW_SECONDS; records peak concurrency per host."""
+    validator = pipeline.LinkValidator(max_workers=8, per_host_limit=4, host_rules=())
+    lock = threading.Lock()
+    active, peak = {}, {}
+
+    def request(url, host):
+        with lock:
+            active[host] = active.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), active[host])
+        time.sleep(SLOW_SECONDS if host == "slow.example" else 0)
+        with lock:
+            active[host] -= 1
+        return True, "Status code: 200"
+    monkeypatch.setattr(validator, "_request", request)
+    return validator, peak
+
+def urls():
+    return [f"https://slow.example/{n}" for n in range(16)] + ["https://fast.example/"]
+
+def test_slow_host_does_not_hold_workers_from_other_hosts(pipeline, monkeypatch):
+    validator, peak = slow_host_validator(pipeline, monkeypatch)
+    try:
+        slow = [validator._start(url) for url in urls()[:-1]]
+        started = time.monotonic()
+        assert validator.check("https://fast.example/") == (True, "Status code: 200")
+        assert time.monotonic() - started < SLOW_SECONDS
+        assert all(future.result(timeout=10)[0] for future in slow)
+    finally:
+        validator.close()
+    assert peak["slow.example"] == 4
+
+def test_async_validation_applies_the_same_host_limit(pipeline, monkeypatch):
+    validator, peak = slow_host_validator(pipeline, monkeypatch)
+    try:
+        results = asyncio.run(validator.validate_urls_async(urls() + urls()[:2]))
+    finally:
+        validator.close()
+    assert list(results) == urls()
+    assert all(is_valid for is_valid, _ in results.values())
+    assert peak["slow.example"] == 4
@@ -0,0 +1,195 @@
+"""Tests for single-flight grading of duplicate responses and the packed-grading packer."""
+import concurrent.futures
+import threading
+
+import pytest
+
+CRITERIA = {"task_summary": "Summary", "evaluation_criteria": "Criteria"}
+
+def packed_entry(pipeline, data):
+    return {
+        "key": pipeline.RunJournal.row_key(data), "grade_future": None, "task_data": data, "criteria": CRITERIA,
+        "content_hash": pipeline.compute_content_hash(data["user_content"]), "criteria_hash": "criteria",
+        "questions": pipeline.normalize_task_questions(data["questions"], data["user_content"]),
+        "user_content": data["user_content"],
+    }
+
+class FakeJournal:
+    def __init__(self):
+        self.rows = {}
+
+    def record_row(self, key, row):
+        self.rows[key] = row
+
+def test_exact_duplicates_share_one_grade(pipeline, task_data, graded_row, monkeypatch):
+    pipeline.response_grade_store = pipeline.ResponseGradeStore()
+    graded = []
+
+    def grade(data, task_criteria, content_hash, criteria_hash):
+        graded.append(data["user_id"])
+        return graded_row(data)
+    monkeypatch.setattr(pipeline, "grade_task_response", grade)
+
+    leader = task_data(1)
+    # Case and whitespace differences still count as the same response
+    duplicate = task_data(2, user_content="  " + leader["user_content"].upper())
+    leader_row = pipeline.grade_deduplicated_response(leader, CRITERIA, "hash-1", "criteria")
+    duplicate_row = pipeline.grade_deduplicated_response(duplicate, CRITERIA, "hash-2", "criteria")
+
+    assert graded == [1]
+    assert duplicate_row["user_id"] == 2
+    assert duplicate_row["response_content"] == duplicate["user_content"]
+    assert duplicate_row["content_hash"] == "hash-2"
+    for field in pipeline.SHARED_GRADE_FIELDS:
+        assert duplicate_row[field] == leader_row[field]
+    # The store keeps only the grade, not the leader's response text
+    (future,) = pipeline.response_grade_store._futures.values()
+    assert set(future.result()) == set(pipeline.SHARED_GRADE_FIELDS)
+
+def test_duplicates_of_other_tasks_or_criteria_are_graded_separately(pipeline, task_data):
+    store = pipeline.ResponseGradeStore()
+    assert store.claim(task_data(1), "criteria")[1]
+    assert store.claim(task_data(2, task_id=2), "criteria")[1]
+    assert store.claim(task_data(3), "other-criteria")[1]
+    assert not store.claim(task_data(4), "criteria")[1]
+
+def test_near_duplicates_join_the_group_above_the_threshold(pipeline, task_data):
+    pytest.importorskip("numpy")
+    store = pipeline.ResponseGradeStore(near_duplicate_threshold=0.8)
+    leader_future, is_leader = store.claim(task_data(1), "criteria")
+    assert is_leader
+
+    near_future, is_leader = store.claim(task_data(2, user_content=task_data(2)["user_content"] + " Thanks."),
+                                         "criteria")
+    assert not is_leader
+    assert near_future is leader_future
+
+    different = "My week went into reading papers about agents; I did not get to build anything yet."
+    assert store.claim(task_data(3, user_content=different), "criteria")[1]
+
+def test_leader_failure_releases_waiting_duplicates(pipeline, task_data, monkeypatch):
+    pipeline.response_grade_store = pipeline.ResponseGradeStore()
+    leader_started = threading.Event()
+    release_leader = threading.Event()
+
+    def failing_grade(data, task_criteria, content_hash, criteria_hash):
+        leader_started.set()
+        release_leader.wait(5)
+        raise RuntimeError("grading failed")
+    monkeypatch.setattr(pipeline, "grade_task_response", failing_grade)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(pipeline.grade_deduplicated_response, task_data(1), CRITERIA, "h1", "criteria")
+        assert leader_started.wait(5)
+        duplicates = [executor.submit(pipeline.grade_deduplicated_response, task_data(user_id), CRITERIA,
+                                      f"h{user_id}", "criteria")
+                      for user_id in (2, 3)]
+        release_leader.set()
+        with pytest.raises(RuntimeError):
+            leader.result(timeout=5)
+        assert [duplicate.result(timeout=5) for duplicate in duplicates] == [None, None]
+
+def test_prepare_packed_response_failure_claims_nothing(pipeline, task_data, monkeypatch):
+    monkeypatch.setattr(pipeline, "resolve_task_grading",
+                        lambda data, grade_index=None: (CRITERIA, "hash", "criteria", "grade"))
+    store = pipeline.ResponseGradeStore()
+    packer = pipeline.ResponsePacker(max_tokens=7000, max_responses=8, grade_store=store)
+    # Questions stored as a JSON object make normalize_task_questions raise
+    bad = [task_data(user_id, questions='{"q": "What?"}') for user_id in (1, 2)]
+    items = [pipeline.prepare_packed_response(data, FakeJournal()) for data in bad]
+
+    assert items == [None, None]
+    assert list(packer.pack(items)) == []
+    assert store._futures == {}
+
+def test_packer_holds_back_duplicates_until_their_pack_is_graded(pipeline, task_data):
+    store = pipeline.ResponseGradeStore()
+    packer = pipeline.ResponsePacker(max_tokens=7000, max_responses=2, grade_store=store)
+    items = [
+        packed_entry(pipeline, task_data(1)),
+        packed_entry(pipeline, task_data(2)),  # duplicate of user 1
+        packed_entry(pipeline, task_data(3, user_content="A different answer about prompt design.")),
+        packed_entry(pipeline, task_data(4, task_id=2)),
+    ]
+    stream = packer.pack(items)
+
+    first = next(stream)
+    # Users 1 and 3 fill a pack; the duplicate is not packed with its leader
+    assert [entry["task_data"]["user_id"] for entry in first] == [1, 3]
+    rest = list(stream)
+    assert [entry["task_data"]["user_id"] for entry in rest[0]] == [4]
+    assert rest[1]["task_data"]["user_id"] == 2
+    assert rest[1]["duplicate_of"] is first[0]["grade_future"]
+    assert packer.items_seen == 4
+
+def test_packer_emits_duplicates_once_their_grade_is_ready(pipeline, task_data, graded_row):
+    store = pipeline.ResponseGradeStore()
+    packer = pipeline.ResponsePacker(max_tokens=7000, max_responses=1, grade_store=store)
+    stream = packer.pack([
+        packed_entry(pipeline, task_data(1)),
+        packed_entry(pipeline, task_data(2)),
+        packed_entry(pipeline, task_data(3, task_id=2)),
+    ])
+    (leader,) = next(stream)
+    leader["grade_future"].set_result(pipeline.shared_grade(graded_row(leader["task_data"])))
+    # The resolved duplicate comes out as soon as the next item is read, ahead of later packs
+    assert next(stream)["task_data"]["user_id"] == 2
+    assert [entry["task_data"]["user_id"] for entry in next(stream)] == [3]
+
+def test_packer_budgets_the_whole_request(pipeline, task_data):
+    entries = [packed_entry(pipeline, task_data(user_id, user_content=f"Answer {user_id}. " + "word " * 600))
+               for user_id in range(1, 7)]
+    two_responses = pipeline.estimate_packed_request_tokens(entries[:2])
+    packer = pipeline.ResponsePacker(max_tokens=two_responses, max_responses=8)
+
+    packs = list(packer.pack(entries))
+
+    assert [len(pack) for pack in packs] == [2, 2, 2]
+    for pack in packs:
+        assert pipeline.estimate_packed_request_tokens(pack) <= two_responses
+
+def test_packer_builds_the_same_packs_for_the_same_input(pipeline, task_data):
+    def packs():
+        store = pipeline.ResponseGradeStore()
+        packer = pipeline.ResponsePacker(max_tokens=7000, max_responses=3, grade_store=store)
+        entries = [packed_entry(pipeline, task_data(user_id, task_id=1 + user_id % 2,
+                                                    user_content=f"Answer number {user_id}"))
+                   for user_id in range(1, 11)]
+        return [[entry["key"] for entry in item] for item in packer.pack(entries)]
+
+    assert packs() == packs()
+
+def test_failed_pack_request_grades_each_response_and_releases_duplicates(pipeline, task_data, graded_row, monkeypatch):
+    def failing_completion(**kwargs):
+        raise pipeline.OpenAIRequestError("context length exceeded")
+    monkeypatch.setattr(pipeline, "create_chat_completion", failing_completion)
+    monkeypatch.setattr(pipeline, "grade_task_response",
+                        lambda data, task_criteria, content_hash, criteria_hash: graded_row(data))
+    store = pipeline.ResponseGradeStore()
+    packer = pipeline.ResponsePacker(max_tokens=7000, max_responses=8, grade_store=store)
+    items = list(packer.pack([
+        packed_entry(pipeline, task_data(1)),
+        packed_entry(pipeline, task_data(2, user_content="Another answer")),
+        packed_entry(pipeline, task_data(3)),
+    ]))
+    pack, duplicate = items
+    journal = FakeJournal()
+
+    rows = pipeline.grade_packed_item(pack, journal)
+
+    assert [row["user_id"] for row in rows] == [1, 2]
+    assert all(entry["grade_future"].done() for entry in pack)
+    assert pipeline.grade_packed_item(duplicate, journal)[0]["user_id"] == 3
+    assert len(journal.rows) == 3
+
+def test_malformed_grades_are_left_out_of_the_grade_index(pipeline, task_data, monkeypatch):
+    pipeline.response_grade_store = pipeline.ResponseGradeStore()
+    monkeypatch.setattr(pipeline, "create_chat_completion", lambda **kwargs: "not json")
+
+    leader_row = pipeline.grade_deduplicated_response(task_data(1), CRITERIA, "hash-1", "criteria")
+    duplicate_row = pipeline.grade_deduplicated_response(task_data(2), CRITERIA, "hash-2", "criteria")
+
+    # Without hashes load_grade_index skips the rows, so the next run grades the responses again
+    for row in (leader_row, duplicate_row):
+        assert row["scores"] == "0.0"
+        assert (row["content_hash"], row["criteria_hash"]) == (None, None)
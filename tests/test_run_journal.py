@@ -0,0 +1,28 @@
+"""Tests for resuming grading runs from the run journal."""
+import json
+
+def test_reused_rows_are_not_journaled(pipeline, task_data, graded_row, tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = pipeline.RunJournal(path)
+    graded, reused = task_data(1), task_data(2)
+    journal.record_row(pipeline.RunJournal.row_key(graded), graded_row(graded))
+    journal.record_row(pipeline.RunJournal.row_key(reused), pipeline.build_reused_response(reused, "hash", "criteria"))
+    journal.close()
+
+    resumed = pipeline.RunJournal(path)
+
+    assert list(resumed.rows) == [pipeline.RunJournal.row_key(graded)]
+
+def test_reused_rows_from_older_journals_are_ignored(pipeline, task_data, tmp_path):
+    path = tmp_path / "run.jsonl"
+    reused = task_data(2)
+    path.write_text(json.dumps({"key": pipeline.RunJournal.row_key(reused),
+                                "row": pipeline.build_reused_response(reused, "hash", "criteria")}) + "\n")
+
+    assert pipeline.RunJournal(str(path)).rows == {}
+
+def test_default_run_id_follows_the_week_range(pipeline):
+    assert pipeline.parse_args([]).run_id == "weeks-2025-03-15-to-latest"
+    args = pipeline.parse_args(["--start-week", "2025-03-25", "--end-week", "2025-04-07", "--incremental"])
+    assert args.run_id == "weeks-2025-03-22-to-2025-04-05"
+    assert pipeline.parse_args(["--run-id", "backfill"]).run_id == "backfill"
@@ -0,0 +1,31 @@
+"""Tests for the local-first tiered sentiment engine."""
+import asyncio
+
+import pytest
+
+class RecordingBackend:
+    """Fallback engine that records the texts escalated to it."""
+
+    name = "recording"
+
+    def __init__(self):
+        self.texts = []
+
+    async def analyze(self, texts):
+        self.texts.extend(texts)
+        return [{"score": 0.0, "magnitude": 0.0, "confidence": 1.0, "backend": self.name} for _ in texts]
+
+    async def close(self):
+        pass
+
+def test_texts_with_a_single_lexicon_hit_are_escalated(pipeline):
+    pytest.importorskip("numpy")
+    fallback = RecordingBackend()
+    backend = pipeline.TieredSentimentBackend(pipeline.LexiconSentimentBackend(), fallback)
+    single_hit = "The session was good but I am completely lost and want to quit."
+    agreeing = "Great job this week, really helpful and supportive."
+
+    results = asyncio.run(backend.analyze([single_hit, agreeing]))
+
+    assert fallback.texts == [single_hit]
+    assert results[1]["backend"] == "lexicon"